@@ -2,13 +2,21 @@
 import os
 import re
 import sys
+import asyncio
+import html
 import logging
+from datetime import timedelta
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from urllib.parse import quote, urljoin, urlparse
 
-import requests
+import aiohttp
+import orjson
 import tweepy
+from aiolimiter import AsyncLimiter
+from aiohttp_client_cache import CachedSession, SQLiteBackend
 import gspread
-import xml.etree.ElementTree as ET
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
 
 # ── CONFIG ─────────────────────────────────────────────────────────────────────
@@ -18,8 +26,24 @@ SPREADSHEET_ID     = "1oYdQyh1tqPA3821PE97ru8aL8jZOe1e7vKLp2x7BSF8"  # Google Sh
 SERVICE_ACCOUNT_FN = "service_account.json"                      # Service account JSON filename
 HISTORICAL_FILE    = Path("extracted_tweets.txt")                # Historical tweets file
 SINCE_ID_FILE      = Path("since_id.txt")                        # Tracks last seen tweet ID
+USER_ID_FILE       = Path("user_id.txt")                         # Cached "username:id" of TW_USERNAME
+HTTP_CACHE_FILE    = Path("http_cache.sqlite")                   # On-disk cache of DOI/API responses
 START_TIME         = "2025-03-25T00:00:00Z"                       # Only fetch tweets after this date initially
 MAX_RESULTS        = 10                                           # Max tweets per API call
+HTTP_TIMEOUT       = 10                                           # Seconds allowed to connect, and between reads
+CONNS_PER_HOST     = 8                                            # Pooled connections per remote host
+MAX_CONNECTIONS    = 32                                           # Pooled connections across all hosts
+KEEPALIVE_TIMEOUT  = 30                                           # Seconds an idle pooled connection is kept open
+RESOLVE_WORKERS    = 16                                           # Concurrent URL -> DOI resolvers
+FETCH_WORKERS      = 8                                            # Concurrent DOI -> metadata/abstract fetchers
+QUEUE_SIZE         = 256                                          # Bound on items waiting between pipeline stages
+SS_BATCH_SIZE      = 500                                          # Max IDs per Semantic Scholar paper/batch call
+MAX_REDIRECTS      = 3                                            # Redirect hops followed when resolving a URL
+HTML_PEEK_BYTES    = 65536                                        # Bytes of a landing page scanned for citation_doi
+CROSSREF_FIELDS    = ("DOI,title,container-title,author,issued,"  # Only the Crossref fields fetch_metadata reads
+                      "published-print,published-online,abstract")
+MAX_RETRIES        = 3                                            # Retries on HTTP 429/503 before giving up
+CONTACT_EMAIL      = os.environ.get("CROSSREF_MAILTO", "")        # Sent to Crossref for polite-pool access
 
 # ── LOGGING SETUP ────────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -28,19 +52,118 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ── PATTERNS ────────────────────────────────────────────────────────────────────
+DOI_RE      = re.compile(r"(10\.\d{4,9}/[-._;()/:A-Za-z0-9]+)")
+URL_RE      = re.compile(r"https?://\S+")
+META_DOI_RE = re.compile(rb'<meta name="citation_doi" content="([^"]+)"')
+JATS_TITLE_RE = re.compile(r"<jats:title>.*?</jats:title>", re.S)
+JATS_BLOCK_RE = re.compile(r"</?jats:(?:p|sec|list-item)\b[^>]*>")
+JATS_TAG_RE   = re.compile(r"<[^>]+>")
+
+# ── HTTP SESSION ─────────────────────────────────────────────────────────────────
+# Per-API budgets: Crossref ~50 req/s, Semantic Scholar 100 req / 5 min.
+CROSSREF_LIMITER         = AsyncLimiter(50, 1)
+SEMANTIC_SCHOLAR_LIMITER = AsyncLimiter(1, 3)
+RETRY_STATUSES           = {429, 502, 503, 504}
+SS_BATCH_URL             = "https://api.semanticscholar.org/graph/v1/paper/batch?fields=abstract"
+USER_AGENT = "twitter-paper-feed/1.0" + (f" (mailto:{CONTACT_EMAIL})" if CONTACT_EMAIL else "")
+
+# Hits are kept for a month; misses (404, empty Crossref lookups) are never stored.
+CACHE_TTL          = timedelta(days=30)
+CACHEABLE_STATUSES = (200, 301, 302, 303, 307, 308)
+
+
+def open_session() -> CachedSession:
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONNECTIONS,
+        limit_per_host=CONNS_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=300,
+    )
+    # No total timeout, so waiting for a pooled connection doesn't count.
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=HTTP_TIMEOUT, sock_read=HTTP_TIMEOUT)
+    cache = SQLiteBackend(
+        cache_name=str(HTTP_CACHE_FILE),
+        expire_after=CACHE_TTL,
+        allowed_codes=CACHEABLE_STATUSES,
+        allowed_methods=("GET", "HEAD"),
+    )
+    return CachedSession(cache=cache, connector=connector, timeout=timeout,
+                         headers={"User-Agent": USER_AGENT})
+
+
+def _retry_delay(retry_after: str | None, attempt: int) -> float:
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return 2 ** attempt
+
+
+async def request_with_retry(session: aiohttp.ClientSession, url: str, limiter: AsyncLimiter,
+                             method: str = "GET", **kwargs) -> tuple[int, bytes]:
+    """Send a request under ``limiter``, backing off on 429/5xx; returns (status, body)."""
+    for attempt in range(MAX_RETRIES + 1):
+        async with limiter:
+            async with session.request(method, url, **kwargs) as r:
+                if r.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    return r.status, await r.read()
+                delay = _retry_delay(r.headers.get("Retry-After"), attempt)
+        logger.warning(f"HTTP {r.status} from {url}; retrying in {delay:.0f}s")
+        await asyncio.sleep(delay)
+
 # ── HISTORICAL IMPORT ─────────────────────────────────────────────────────────────
-def fetch_historical_urls() -> list[str]:
+def iter_historical_urls() -> Iterator[str]:
     if not HISTORICAL_FILE.exists():
         logger.warning(f"Historical file not found: {HISTORICAL_FILE}")
-        return []
-    content = HISTORICAL_FILE.read_text(encoding="utf-8")
-    return re.findall(r'https?://\S+', content)
+        return
+    # URLs never span lines, so scanning line by line keeps memory flat.
+    seen = set()
+    with HISTORICAL_FILE.open("r", encoding="utf-8") as f:
+        for line in f:
+            for url in URL_RE.findall(line):
+                if url not in seen:
+                    seen.add(url)
+                    yield url
 
 # ── LIVE TWEET FETCH ─────────────────────────────────────────────────────────────
+def load_int(path: Path) -> int | None:
+    if not path.exists():
+        return None
+    try:
+        return int(path.read_text().strip())
+    except (ValueError, OSError) as e:
+        logger.warning(f"Ignoring unreadable {path}: {e}")
+        return None
+
+
+def save_text(path: Path, text: str):
+    # Write-then-rename so a killed run never leaves a truncated file behind.
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def load_since_id() -> int | None:
+    return load_int(SINCE_ID_FILE)
+
+
+def get_user_id(client: tweepy.Client) -> int:
+    # Stored as "username:id" so changing TW_USERNAME forces a re-fetch.
+    try:
+        username, _, cached_id = USER_ID_FILE.read_text().strip().partition(":")
+        if username.lower() == TW_USERNAME.lower():
+            return int(cached_id)
+    except (ValueError, OSError):
+        pass
+    user_id = client.get_user(username=TW_USERNAME).data.id
+    save_text(USER_ID_FILE, f"{TW_USERNAME}:{user_id}")
+    return user_id
+
+
 def fetch_new_tweets(since_id: int | None) -> list[tweepy.Tweet]:
     client = tweepy.Client(bearer_token=TW_BEARER_TOKEN)
     try:
-        user = client.get_user(username=TW_USERNAME).data
+        user_id = get_user_id(client)
     except Exception as e:
         logger.error(f"Unable to fetch user '{TW_USERNAME}': {e}")
         return []
@@ -51,41 +174,104 @@ def fetch_new_tweets(since_id: int | None) -> list[tweepy.Tweet]:
     else:
         params["start_time"] = START_TIME
 
-    resp = client.get_users_tweets(id=user.id, **params)
+    resp = client.get_users_tweets(id=user_id, **params)
     tweets = resp.data or []
     if tweets:
         max_id = max(t.id for t in tweets)
-        SINCE_ID_FILE.write_text(str(max_id))
+        save_text(SINCE_ID_FILE, str(max_id))
     logger.info(f"Fetched {len(tweets)} new tweets")
     return tweets
 
+
+def iter_tweet_sources(tweets: list[tweepy.Tweet]) -> Iterator[tuple[str, str]]:
+    """Yield each distinct (expanded_url, tweet_date) once per tweet."""
+    for tw in tweets:
+        tweet_date = tw.created_at.isoformat()
+        seen = set()
+        for u in (tw.entities or {}).get("urls", []):
+            url = u.get("expanded_url")
+            if not url or url in seen:
+                continue
+            seen.add(url)
+            yield url, tweet_date
+
 # ── DOI EXTRACTION ──────────────────────────────────────────────────────────────
-def extract_doi(url: str) -> str | None:
-    m = re.search(r"(10\.\d{4,9}/[-._;()/:A-Za-z0-9]+)", url)
+# Hosts (and subdomains) that never lead to a DOI.
+NON_DOI_HOSTS = {
+    "x.com", "twitter.com", "youtube.com", "youtu.be", "github.com", "linkedin.com",
+    "facebook.com", "instagram.com", "zoom.us", "sites.google.com", "arxiv.org",
+}
+# Publishers serving DOI-less landing URLs directly: skip the HEAD walk.
+LANDING_PAGE_HOSTS = {
+    "sciencedirect.com", "nature.com", "pubs.rsc.org", "mdpi.com", "cell.com",
+}
+
+
+def host_in(host: str, hosts: set[str]) -> bool:
+    return any(host == h or host.endswith("." + h) for h in hosts)
+
+
+async def extract_doi(session: aiohttp.ClientSession, url: str) -> str | None:
+    m = DOI_RE.search(url)
     if m:
         return m.group(1)
+    host = (urlparse(url).hostname or "").lower()
+    if host_in(host, NON_DOI_HOSTS):
+        return None
+    # Follow redirects by hand with HEAD, stopping once a Location carries a DOI.
     try:
-        head = requests.head(url, allow_redirects=True, timeout=10)
-        m2 = re.search(r"(10\.\d{4,9}/[-._;()/:A-Za-z0-9]+)", head.url)
-        if m2:
-            return m2.group(1)
-    except:
+        for _ in range(0 if host_in(host, LANDING_PAGE_HOSTS) else MAX_REDIRECTS):
+            async with session.head(url, allow_redirects=False) as head:
+                location = head.headers.get("Location")
+            if not location:
+                break
+            url = urljoin(url, location)
+            m2 = DOI_RE.search(url)
+            if m2:
+                return m2.group(1)
+    except Exception:
         pass
+    # Last resort: read only <head> for citation_doi, bypassing the cache.
     try:
-        html = requests.get(url, timeout=10).text
-        m3 = re.search(r'<meta name="citation_doi" content="([^"]+)"', html)
+        page = b""
+        async with session.get(url, max_redirects=MAX_REDIRECTS, expire_after=0) as r:
+            # Redirects past the HEAD walk may still land on a DOI-bearing URL.
+            m2 = DOI_RE.search(str(r.url))
+            if m2:
+                return m2.group(1)
+            async for chunk in r.content.iter_chunked(8192):
+                scan_from = max(0, len(page) - len(b"</head>"))
+                page += chunk
+                if b"</head>" in page[scan_from:] or len(page) >= HTML_PEEK_BYTES:
+                    break
+        m3 = META_DOI_RE.search(page)
         if m3:
-            return m3.group(1)
-    except:
+            return m3.group(1).decode("utf-8", "ignore")
+    except Exception:
         pass
     return None
 
 # ── METADATA & ABSTRACT ─────────────────────────────────────────────────────────
-def fetch_metadata(doi: str) -> dict:
-    api_url = f"https://api.crossref.org/works/{doi}"
-    r = requests.get(api_url, timeout=10)
-    r.raise_for_status()
-    msg = r.json()["message"]
+def strip_jats(raw: str) -> str:
+    """Flatten a Crossref JATS abstract to plain text, dropping its heading."""
+    text = JATS_BLOCK_RE.sub(" ", JATS_TITLE_RE.sub(" ", raw))
+    text = JATS_TAG_RE.sub("", text)
+    return " ".join(html.unescape(text).split())
+
+
+async def fetch_metadata(session: CachedSession, doi: str) -> dict:
+    # works/{doi} rejects select=, so filter the list route by DOI instead.
+    api_url = (f"https://api.crossref.org/works?filter=doi:{quote(doi, safe='/:;()')}"
+               f"&select={CROSSREF_FIELDS}&rows=1")
+    status, body = await request_with_retry(session, api_url, CROSSREF_LIMITER)
+    if status != 200:
+        raise RuntimeError(f"Crossref returned HTTP {status}")
+    items = orjson.loads(body)["message"]["items"]
+    if not items:
+        # Fresh papers are often not indexed yet; don't keep the miss for a month.
+        await session.cache.delete_url(api_url)
+        raise RuntimeError("DOI not found in Crossref")
+    msg = items[0]
     title   = msg.get("title", [""])[0]
     journal = msg.get("container-title", [""])[0]
     authors = [f"{a.get('given','')} {a.get('family','')}".strip() for a in msg.get("author", [])]
@@ -94,33 +280,90 @@ def fetch_metadata(doi: str) -> dict:
     pub_date = "-".join(str(p) for p in parts if p is not None) if parts[0] else ""
     issued = msg.get("issued", {})
     year   = issued.get("date-parts", [[None]])[0][0]
+    abstract = strip_jats(msg.get("abstract", ""))
     return {"title": title, "authors": authors, "journal": journal,
-            "year": year, "pub_date": pub_date, "doi": doi}
+            "year": year, "pub_date": pub_date, "doi": doi, "abstract": abstract}
 
 
-def fetch_abstract(doi: str) -> str:
-    ss_url = f"https://api.semanticscholar.org/graph/v1/paper/DOI:{doi}?fields=abstract"
-    try:
-        r = requests.get(ss_url, timeout=10)
-        if r.status_code == 200:
-            abs_txt = r.json().get("abstract")
-            if abs_txt:
-                return abs_txt
-    except:
-        pass
-    xml_url = f"https://api.crossref.org/works/{doi}.xml"
-    try:
-        x = requests.get(xml_url, timeout=10)
-        if x.status_code == 200:
-            root = ET.fromstring(x.content)
-            el = root.find(".//abstract")
-            if el is not None:
-                return ET.tostring(el, method="text", encoding="unicode").strip()
-    except:
-        pass
-    return ""
+async def fetch_semantic_scholar_abstracts(session: aiohttp.ClientSession,
+                                           dois: list[str]) -> dict[str, str]:
+    """Look up abstracts for many DOIs via paper/batch, SS_BATCH_SIZE per request."""
+    abstracts = {}
+    for i in range(0, len(dois), SS_BATCH_SIZE):
+        chunk = dois[i:i + SS_BATCH_SIZE]
+        try:
+            status, body = await request_with_retry(
+                session, SS_BATCH_URL, SEMANTIC_SCHOLAR_LIMITER, method="POST",
+                json={"ids": [f"DOI:{doi}" for doi in chunk]},
+            )
+            if status != 200:
+                logger.warning(f"Semantic Scholar batch returned HTTP {status}")
+                continue
+            # Results come back in request order, with null for unknown IDs.
+            for doi, paper in zip(chunk, orjson.loads(body)):
+                if paper and paper.get("abstract"):
+                    abstracts[doi] = paper["abstract"]
+        except Exception as e:
+            logger.warning(f"Semantic Scholar batch lookup failed: {e}")
+    return abstracts
+
+# ── PER-URL PIPELINE ────────────────────────────────────────────────────────────
+async def fetch_papers(sources: Iterable[tuple[str, str]], known_dois: set[str] = frozenset()) -> list[tuple]:
+    """Resolve URLs to new DOIs, then fetch their metadata, via bounded worker queues."""
+    url_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    doi_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    seen = set(known_dois)
+    papers = []
+
+    async def resolve_worker():
+        while True:
+            url, tweet_date = await url_queue.get()
+            try:
+                doi = await extract_doi(session, url)
+                if not doi:
+                    logger.info(f"Skipping URL (no DOI): {url}")
+                elif doi.lower() in seen:
+                    logger.info(f"Skipping duplicate DOI {doi}: {url}")
+                else:
+                    seen.add(doi.lower())
+                    await doi_queue.put((doi, url, tweet_date))
+            except Exception as e:
+                logger.error(f"Resolving failed for URL {url}: {e}")
+            finally:
+                url_queue.task_done()
+
+    async def fetch_worker():
+        while True:
+            doi, url, tweet_date = await doi_queue.get()
+            try:
+                meta = await fetch_metadata(session, doi)
+                papers.append((meta, url, tweet_date))
+            except Exception as e:
+                logger.error(f"Processing failed for DOI {doi}: {e}")
+            finally:
+                doi_queue.task_done()
+
+    async with open_session() as session:
+        workers = ([asyncio.create_task(resolve_worker()) for _ in range(RESOLVE_WORKERS)]
+                   + [asyncio.create_task(fetch_worker()) for _ in range(FETCH_WORKERS)])
+        for source in sources:
+            await url_queue.put(source)
+        await url_queue.join()
+        await doi_queue.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # Only papers Crossref had no abstract for go to Semantic Scholar.
+        missing = [meta["doi"] for meta, _, _ in papers if not meta["abstract"]]
+        abstracts = await fetch_semantic_scholar_abstracts(session, missing)
+    return [(meta, meta["abstract"] or abstracts.get(meta["doi"], ""), url, tweet_date)
+            for meta, url, tweet_date in papers]
 
 # ── GOOGLE SHEETS ───────────────────────────────────────────────────────────────
+PUB_DATE_COLUMN = 5  # 1-based columns (see build_row)
+DOI_COLUMN      = 7
+
+
 def init_sheet():
     scopes = ["https://www.googleapis.com/auth/spreadsheets",
               "https://www.googleapis.com/auth/drive"]
@@ -129,8 +372,13 @@ def init_sheet():
     return client.open_by_key(SPREADSHEET_ID).sheet1
 
 
-def append_row(sheet, meta: dict, abstract: str, source_url: str, tweet_date: str = ""):
-    row = [
+def existing_dois(sheet) -> set[str]:
+    """Lower-cased DOIs already in the sheet, read with a single request."""
+    return {doi.strip().lower() for doi in sheet.col_values(DOI_COLUMN)[1:] if doi.strip()}
+
+
+def build_row(meta: dict, abstract: str, source_url: str, tweet_date: str = "") -> list:
+    return [
         meta["title"],
         "; ".join(meta["authors"]),
         meta["journal"],
@@ -141,29 +389,36 @@ def append_row(sheet, meta: dict, abstract: str, source_url: str, tweet_date: st
         source_url,
         tweet_date
     ]
-    sheet.append_row(row, value_input_option="USER_ENTERED")
-    logger.info(f"Appended DOI {meta['doi']}")
-    sheet.sort((5, "desc"))
+
+
+def write_rows(sheet, rows: list[list]):
+    """Write all rows after the last one in one values.update, then re-sort once."""
+    if not rows:
+        return
+    # Read the end of data only now, as another run may have appended meanwhile.
+    start_row = len(sheet.col_values(DOI_COLUMN)) + 1
+    end_row = start_row + len(rows) - 1
+    if end_row > sheet.row_count:
+        sheet.add_rows(end_row - sheet.row_count)
+    title = sheet.title.replace("'", "''")  # A1 notation doubles quotes in sheet names
+    sheet.spreadsheet.values_update(
+        f"'{title}'!A{start_row}",
+        params={"valueInputOption": "USER_ENTERED"},
+        body={"values": rows},
+    )
+    logger.info(f"Wrote {len(rows)} rows at row {start_row}")
+    try:
+        sheet.sort((PUB_DATE_COLUMN, "des"), range=f"A2:{rowcol_to_a1(end_row, len(rows[0]))}")
+    except Exception as e:
+        logger.error(f"Sorting sheet failed: {e}")
 
 # ── PROCESS HISTORICAL ─────────────────────────────────────────────────────────
 def process_historical():
     sheet = init_sheet()
-    urls = fetch_historical_urls()
-    seen = set()
-    for url in urls:
-        if url in seen:
-            continue
-        seen.add(url)
-        doi = extract_doi(url)
-        if not doi:
-            logger.info(f"Skipping historical URL (no DOI): {url}")
-            continue
-        try:
-            meta = fetch_metadata(doi)
-            abstract = fetch_abstract(doi)
-            append_row(sheet, meta, abstract, url)
-        except Exception as e:
-            logger.error(f"Historical processing failed for DOI {doi}: {e}")
+    sources = ((url, "") for url in iter_historical_urls())
+    papers = asyncio.run(fetch_papers(sources, existing_dois(sheet)))
+    rows = [build_row(*paper) for paper in papers]
+    write_rows(sheet, rows)
 
 # ── PROCESS LIVE ───────────────────────────────────────────────────────────────
 def process_live():
@@ -171,27 +426,11 @@ def process_live():
         logger.error("TW_BEARER_TOKEN must be set for live imports")
         sys.exit(1)
     sheet = init_sheet()
-    since_id = None
-    if SINCE_ID_FILE.exists():
-        try:
-            since_id = int(SINCE_ID_FILE.read_text().strip())
-        except ValueError:
-            since_id = None
-    tweets = fetch_new_tweets(since_id)
-    for tw in tweets:
-        for u in (tw.entities or {}).get("urls", []):
-            source = u.get("expanded_url")
-            doi = extract_doi(source)
-            if not doi:
-                logger.info(f"Skipping live URL (no DOI): {source}")
-                continue
-            try:
-                meta = fetch_metadata(doi)
-                abstract = fetch_abstract(doi)
-                tweet_date = tw.created_at.isoformat()
-                append_row(sheet, meta, abstract, source, tweet_date)
-            except Exception as e:
-                logger.error(f"Live processing failed for DOI {doi}: {e}")
+    tweets = fetch_new_tweets(load_since_id())
+    sources = iter_tweet_sources(tweets)
+    papers = asyncio.run(fetch_papers(sources, existing_dois(sheet)))
+    rows = [build_row(*paper) for paper in papers]
+    write_rows(sheet, rows)
 
 # ── ENTRY POINT ────────────────────────────────────────────────────────────────
 def main():